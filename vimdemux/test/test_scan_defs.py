@@ -0,0 +1,155 @@
+"""Used to test the def / class scanner in utils.py.
+
+The scanner is compared line by line against an oracle that derives the
+same (class, function) answer from the real AST, over source that is
+known to break naive line scanning: multi-line strings holding
+column-zero def-lookalike text, black-style wrapped signatures,
+single-line defs, defs under if blocks and nested defs.
+"""
+
+import ast
+import os
+import tempfile
+import unittest
+
+import vimdemux.utils as utils
+
+TRICKY_SOURCE = '''import unittest
+
+
+def helper():
+    query = """
+SELECT *
+FROM t
+def fake_def(x):
+"""
+    return query
+
+
+class TestA(unittest.TestCase):
+    def test_one(self):
+        expected = """
+def another_fake(y):
+    return y
+"""
+        self.assertTrue(expected)
+        self.assertTrue(helper())
+
+    def test_two(self):
+        self.assertTrue(True)
+
+
+class TestB(unittest.TestCase):
+    def test_wrapped(
+        self,
+    ):
+        value = (
+            1 +
+            2
+        )
+        self.assertEqual(3, value)
+
+    def test_tail(self): return None
+
+
+if True:
+    def conditional():
+        def inner():
+            pass
+        return inner
+
+
+class Tail:
+    pass
+'''
+
+
+def _oracle_rows(source):
+    """Returns the (start, end, class_name, func_name) rows per the AST.
+
+    Mirrors what the scanner is expected to produce: one row per class
+    and per function / method, nothing nested inside a def.
+    """
+    rows = []
+
+    def collect(node, class_name):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                rows.append((child.lineno, child.end_lineno, child.name,
+                             None))
+                collect(child, child.name)
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                rows.append((child.lineno, child.end_lineno, class_name,
+                             child.name))
+            elif isinstance(child, (ast.stmt, ast.excepthandler)):
+                collect(child, class_name)
+
+    collect(ast.parse(source), None)
+    return rows
+
+
+def _oracle_enclosing(rows, lineno):
+    """Returns the innermost (class_name, func_name) covering the line."""
+    best = None
+    for start, end, class_name, func_name in rows:
+        if start <= lineno <= end and (best is None or start > best[0]):
+            best = (start, class_name, func_name)
+    if best is None:
+        return None, None
+    return best[1], best[2]
+
+
+class TestScanDefs(unittest.TestCase):
+
+    def _check_against_oracle(self, source):
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".py", delete=False,
+                encoding="utf-8") as fout:
+            fout.write(source)
+            filename = fout.name
+        try:
+            rows = _oracle_rows(source)
+            for lineno in range(1, source.count("\n") + 2):
+                self.assertEqual(
+                    _oracle_enclosing(rows, lineno),
+                    utils._find_enclosing(filename, lineno),
+                    f"line {lineno} of:\n{source}"
+                )
+        finally:
+            os.unlink(filename)
+
+    def test_matches_ast_oracle(self):
+        self._check_against_oracle(TRICKY_SOURCE)
+
+    def test_unicode_identifiers(self):
+        source = (
+            "import unittest\n"
+            "\n"
+            "\n"
+            "class TestSüd(unittest.TestCase):\n"
+            "    def test_süd(self):\n"
+            "        self.assertTrue(True)\n"
+        )
+        self._check_against_oracle(source)
+        with tempfile.NamedTemporaryFile(
+                "w", suffix=".py", delete=False,
+                encoding="utf-8") as fout:
+            fout.write(source)
+            filename = fout.name
+        try:
+            self.assertEqual(
+                ("TestSüd", "test_süd"),
+                utils._find_enclosing(filename, 6)
+            )
+        finally:
+            os.unlink(filename)
+
+    def test_string_contents_do_not_leak(self):
+        rows = utils._scan_defs(__file__)
+        names = {row[3] for row in rows}
+        self.assertNotIn("fake_def", names)
+        self.assertNotIn("another_fake", names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,13 @@
 """Exposes the functions to run and debug python code in tmux."""
 
-import ast
+import bisect
 import enum
-import json
+import functools
 import os
-import pathlib
+import subprocess
+
+# Invariants shared by every invocation, computed once at import time.
+_CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".videmux.config")
 
 
 def run(fullpath, linenum):
@@ -31,9 +34,9 @@ def run(fullpath, linenum):
     """
     filetype = _get_file_type(fullpath)
     if filetype == _FileType.PYTHON_SCRIPT:
-        _run_script(fullpath)
+        _launch_script(fullpath)
     elif filetype == _FileType.PYTHON_TEST:
-        _run_test(fullpath, linenum)
+        _launch_test(fullpath, linenum)
     else:
         print(f"Dont now how to run {fullpath}")
 
@@ -67,174 +70,96 @@ def debug(fullpath, linenum):
       method, the entire test suite present in the file is debugged.
 
     A helper function "_get_file_type" is used to determine the type of Python
-    file, and based on its return value, either "_debug_script" or
-    "_debug_test" is called to start the debugging session.
+    file, and based on its return value, either "_launch_script" or
+    "_launch_test" is called with debug=True to start the debugging
+    session.
     """
     filetype = _get_file_type(fullpath)
     if filetype == _FileType.PYTHON_SCRIPT:
-        _debug_script(fullpath)
+        _launch_script(fullpath, debug=True)
     elif filetype == _FileType.PYTHON_TEST:
-        _debug_test(fullpath, linenum)
+        _launch_test(fullpath, linenum, debug=True)
     else:
         print(f"Dont now how to debug {fullpath}")
 
 
 # Private stuff goes after this line.
 
-def _run_script(fullpath):
-    """Runs the passed in script as a python program.
-
-    Parameters
-    ----------
-    fullpath : str
-        The path to the file that needs to be executed.
-    """
-    fullpath = _get_mapped_filename(fullpath)
-    dirname = os.path.dirname(fullpath)
-    basename = os.path.basename(fullpath)
-    cmds = [
-        f"cd {dirname}",
-        "unset PYTHONBREAKPOINT",
-        "clear",
-        f"python3.10 {basename} "
-    ]
-
-    cmd = ' && '.join(cmds)
-    tmux_command = f"tmux select-pane -R && tmux send-keys '{cmd}' 'C-m'"
-    os.system(tmux_command)
-
-
-def _run_test(fullpath, linenum):
-    """Executes a specific test or a whole test suite.
-
-    This function is intended for testing files.
-
-    If the 'linenum' (representing the cursor's position within a Vim session)
-    falls within a test method or function, only that specific test is
-    executed.
+def _send_to_tmux(cmds):
+    """Types the passed in shell commands into the pane to the right.
 
-    If 'linenum' is outside any specific test, the entire test suite is
-    executed.
+    The commands are joined with '&&' and delivered through a single
+    tmux invocation.
 
     Parameters:
 
-    fullpath (str): The full path to the test file.
-    linenum (int): The line number position of the cursor within a Vim session.
+    cmds (list): The shell commands to run, in order.
     """
-    function_class, function_name = _find_path_to_test(fullpath, linenum)
-    fullpath = _get_mapped_filename(fullpath)
-    if function_name is None:
-        # Not inside a test thus we need to run the whole suite.
-        # Example of the resulting call:
-        # python3.10 -m unittest  test_utils.py
-        dirname = os.path.dirname(fullpath)
-        basename = os.path.basename(fullpath)
-        cmds = [
-            f"cd {dirname}",
-            "clear",
-            f"echo {basename}",
-            f"pytest {basename} "
-        ]
-        cmd = ' && '.join(cmds)
-        tmux_command = f"tmux select-pane -R && tmux send-keys '{cmd}' 'C-m'"
-        os.system(tmux_command)
-    else:
-        # Inside a function. Try to run the specific test.
-        # Example of the resulting call:
-        # python3.10 -m unittest  test_utils.TestClass.test_func
-        dirname = os.path.dirname(fullpath)
-        basename = os.path.basename(fullpath)
-        test_name = basename
-        if function_class:
-            test_name += "::" + function_class
-        test_name += "::" + function_name
-        cmds = [
-            f"cd {dirname}",
-            "clear",
-            f"echo {test_name}",
-            f"pytest {test_name} "
-        ]
-        cmd = ' && '.join(cmds)
-        tmux_command = f"tmux select-pane -R && tmux send-keys '{cmd}' 'C-m'"
-        os.system(tmux_command)
+    cmd = ' && '.join(cmds)
+    subprocess.run(
+        ["tmux", "select-pane", "-R", ";", "send-keys", cmd, "Enter"],
+        check=True
+    )
 
 
-def _debug_script(fullpath):
-    """Debugs the passed in script as a python program.
+def _launch_script(fullpath, debug=False):
+    """Runs or debugs the passed in script as a python program.
 
     Parameters:
 
-    fullpath (str): The full path to the test file.
+    fullpath (str): The path to the file that needs to be executed.
+    debug (bool): When True the script is started under pdb.
     """
     fullpath = _get_mapped_filename(fullpath)
-    dirname = os.path.dirname(fullpath)
-    basename = os.path.basename(fullpath)
-    cmds = [
+    dirname, basename = os.path.split(fullpath)
+    if debug:
+        breakpoint_cmd = "export PYTHONBREAKPOINT=ipdb.set_trace"
+        runner = "python3.10 -m pdb"
+    else:
+        breakpoint_cmd = "unset PYTHONBREAKPOINT"
+        runner = "python3.10"
+    _send_to_tmux([
         f"cd {dirname}",
-        "export PYTHONBREAKPOINT=ipdb.set_trace",
+        breakpoint_cmd,
         "clear",
-        f"python3.10 -m pdb {basename} "
-    ]
-
-    cmd = ' && '.join(cmds)
-    tmux_command = f"tmux select-pane -R && tmux send-keys '{cmd}' 'C-m'"
-    os.system(tmux_command)
+        f"{runner} {basename} "
+    ])
 
 
-def _debug_test(fullpath, linenum):
-    """Executes a specific test or a whole test suite.
+def _launch_test(fullpath, linenum, debug=False):
+    """Runs or debugs a specific test or a whole test suite.
 
     This function is intended for testing files.
 
     If the 'linenum' (representing the cursor's position within a Vim session)
     falls within a test method or function, only that specific test is
-    executed.
+    executed; otherwise the entire test suite is executed.
 
-    If 'linenum' is outside any specific test, the entire test suite is
-    executed.
+    Example of the resulting call:
+    pytest test_utils.py::TestClass::test_func
 
     Parameters:
 
     fullpath (str): The full path to the test file.
     linenum (int): The line number position of the cursor within a Vim session.
+    debug (bool): When True the test is started under pytest --trace.
     """
-    function_class, function_name = _find_path_to_test(fullpath, linenum)
-    if function_name:
-        function_class = _find_enclosing_class(fullpath, linenum)
-
+    function_class, function_name = _find_enclosing(fullpath, linenum)
     fullpath = _get_mapped_filename(fullpath)
-    if function_name is None:
-        # Not inside a test thus we need to run the whole suite.
-        # Example of the resulting call:
-        # python3.10 -m unittest  test_utils.py
-        dirname = os.path.dirname(fullpath)
-        basename = os.path.basename(fullpath)
-        cmds = [
-            f"cd {dirname}",
-            "clear",
-            f"pytest --trace {basename} "
-        ]
-        cmd = ' && '.join(cmds)
-        tmux_command = f"tmux select-pane -R && tmux send-keys '{cmd}' 'C-m'"
-        os.system(tmux_command)
-    else:
-        # Inside a function. Try to run the specific test.
-        # Example of the resulting call:
-        # python3.10 -m unittest  test_utils.TestClass.test_func
-        dirname = os.path.dirname(fullpath)
-        basename = os.path.basename(fullpath)
-        test_name = basename
+    dirname, basename = os.path.split(fullpath)
+    test_name = basename
+    if function_name is not None:
+        # Inside a test; narrow the run down to it.
         if function_class:
             test_name += "::" + function_class
         test_name += "::" + function_name
-        cmds = [
-            f"cd {dirname}",
-            "clear",
-            f"pytest --trace {test_name} "
-        ]
-        cmd = ' && '.join(cmds)
-        tmux_command = f"tmux select-pane -R && tmux send-keys '{cmd}' 'C-m'"
-        os.system(tmux_command)
+    runner = "pytest --trace" if debug else "pytest"
+    _send_to_tmux([
+        f"cd {dirname}",
+        "clear",
+        f"echo {test_name}",
+        f"{runner} {test_name} "
+    ])
 
 
 class _FileType(enum.Enum):
@@ -251,7 +176,6 @@ def _get_file_type(fullpath):
 
     fullpath (str): The full path to the test file.
     """
-    dirname = os.path.dirname(fullpath)
     basename = os.path.basename(fullpath)
     if basename.endswith(".py"):
         p = basename[:-3]
@@ -263,62 +187,230 @@ def _get_file_type(fullpath):
         return _FileType.UNKNOWN
 
 
-def _find_path_to_test(filename, lineno):
-    with open(filename, "r") as source:
-        tree = ast.parse(source.read(), filename)
-    for node in ast.walk(tree):
-        if isinstance(
-                node,
-                ast.FunctionDef) or isinstance(
-                node,
-                ast.AsyncFunctionDef):
-            if node.lineno <= lineno and lineno <= node.body[-1].lineno:
-                function_name = str(node.name)
-                class_name = _find_enclosing_class(filename, node.lineno)
-                return class_name, function_name
-    return None, None
+def _scan_defs(filename):
+    """Scans the token stream for def / class statements.
+
+    The locator only ever needs the start / end span of each class and
+    function, so tokenizing the file is enough; building the full AST
+    (expression trees, string constants and all) was pure overhead.
+    Unlike a plain line scan, the token stream is string- and
+    continuation-aware: multi-line strings and wrapped signatures never
+    open or close a block, because blocks only move on INDENT / DEDENT
+    tokens and a logical line only ends on a NEWLINE token.
 
+    A definition is closed by the DEDENT back to its own depth (or at
+    once when its body sits on the header line), and its end is the
+    last code line seen inside it.  Everything nested inside a def is
+    skipped since it is not addressable as a test; those lines simply
+    extend the enclosing function.
 
-def _find_enclosing_class(filename, lineno):
-    """Returns the name of the function that enclosed the linenum.
+    The file is read as bytes; tokenize detects the source encoding
+    itself, so non-ascii definition names come out properly decoded.
 
     Parameters:
 
-    fullpath (str): The full path to the test file.
-    linenum (int): The line number position of the cursor within a Vim session.
+    filename (str): The full path to the python file.
 
     Returns:
-        Either the name of the enclosing function or None.
+        The (start, end, class_name, func_name) rows, in source order.
+        Rows for a class itself carry func_name=None.
     """
-    with open(filename, "r") as source:
-        tree = ast.parse(source.read(), filename)
-    for node in ast.walk(tree):
-        if isinstance(node, ast.ClassDef):
-            class_name = str(node.name)
-            start_line = node.lineno
-            end_line = node.body[-1].lineno + 1
-            if start_line <= lineno <= end_line:
-                return class_name
-    return None
+    import tokenize
+
+    rows = []
+    # Open definitions as (depth, kind, name, start, class_name).
+    stack = []
+    depth = 0
+    last_line = 0
+    pending = None
+    in_header = False
+    await_block = False
+
+    def close(item):
+        _, kind, name, start, class_name = item
+        if kind == "class":
+            rows.append((start, last_line, name, None))
+        else:
+            rows.append((start, last_line, class_name, name))
+
+    with open(filename, "rb") as source:
+        for token in tokenize.tokenize(source.readline):
+            kind = token.type
+            if kind in (tokenize.ENCODING, tokenize.COMMENT, tokenize.NL):
+                continue
+            if kind == tokenize.ENDMARKER:
+                break
+            if kind == tokenize.NEWLINE:
+                if in_header:
+                    # The header logical line of the open definition
+                    # ended; its body block (if any) comes next.
+                    in_header = False
+                    await_block = True
+                continue
+            if kind == tokenize.INDENT:
+                depth += 1
+                await_block = False
+                continue
+            if await_block:
+                # No INDENT followed the header, so the definition kept
+                # its body on the header line itself.
+                close(stack.pop())
+                await_block = False
+            if kind == tokenize.DEDENT:
+                depth -= 1
+                while stack and depth <= stack[-1][0]:
+                    close(stack.pop())
+                continue
+            last_line = token.end[0]
+            if kind == tokenize.NAME:
+                if pending is not None:
+                    keyword, start = pending
+                    pending = None
+                    if not any(item[1] == "def" for item in stack):
+                        class_name = None
+                        for item in reversed(stack):
+                            if item[1] == "class":
+                                class_name = item[2]
+                                break
+                        stack.append(
+                            (depth, keyword, token.string, start, class_name)
+                        )
+                        in_header = True
+                elif token.string in ("def", "class"):
+                    pending = (token.string, token.start[0])
+            elif pending is not None:
+                pending = None
+    while stack:
+        close(stack.pop())
+    return rows
+
+
+@functools.lru_cache(maxsize=128)
+def _cached_def_table(filename, mtime, size):
+    """Builds the line-interval table for the defs / classes of a file.
+
+    The rows coming out of _scan_defs are sorted by start line so
+    lookups can binary-search them.  The mtime / size arguments are not
+    used directly; they are part of the cache key so that an edited
+    file invalidates its cached table.
 
+    Parameters:
 
-def _load_settings():
-    """Loads the applicable settings.
+    filename (str): The full path to the python file.
+    mtime (float): The modification time of the file.
+    size (int): The size of the file in bytes.
 
-    The settings must be saved under the home directory
-    in a file called .videmux.config in JSON format.
+    Returns:
+        A (starts, rows) pair where starts is the list of start lines
+        parallel to the sorted rows.
+    """
+    rows = sorted(_scan_defs(filename))
+    starts = [row[0] for row in rows]
+    return starts, rows
+
+
+def _find_enclosing(filename, lineno):
+    """Returns the class and function that enclose the passed in line.
+
+    Binary-searches the cached interval table instead of walking the
+    tree per call, so repeat lookups against an unchanged file cost
+    O(log N) in the number of defs.
+
+    Parameters:
+
+    filename (str): The full path to the test file.
+    lineno (int): The line number position of the cursor within a Vim session.
+
+    Returns:
+        A (class_name, function_name) tuple; either item is None when
+        the line is not enclosed by a class / function.
+    """
+    st = os.stat(filename)
+    starts, rows = _cached_def_table(filename, st.st_mtime, st.st_size)
+    idx = bisect.bisect_right(starts, lineno) - 1
+    while idx >= 0:
+        _, end, class_name, func_name = rows[idx]
+        if lineno <= end:
+            return class_name, func_name
+        idx -= 1
+    return None, None
+
+
+@functools.lru_cache(maxsize=4)
+def _load_settings_cached(mtime):
+    """Loads the settings file, memoized on its modification time.
+
+    The mtime argument is only part of the cache key; an edited config
+    file gets a new mtime and thus a fresh parse, while the sentinel
+    mtime=0 covers the missing-file case.
+
+    Parameters:
+
+    mtime (float): The modification time of the config file, or 0 when
+    the file does not exist.
 
     returns: A python dictionary holding the config settings.
     """
-    home_dir = pathlib.Path.home()
-    filename = os.path.join(home_dir, '.videmux.config')
+    if not mtime:
+        return {}
+    import json
     try:
-        with open(filename) as fin:
+        with open(_CONFIG_PATH) as fin:
             return json.load(fin)
     except FileNotFoundError:
         return {}
 
 
+def _config_mtime():
+    """Returns the modification time of the settings file.
+
+    returns: The mtime as a float, or 0 when the file does not exist.
+    """
+    try:
+        return os.stat(_CONFIG_PATH).st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def _load_settings():
+    """Loads the applicable settings.
+
+    The settings must be saved under the home directory
+    in a file called .videmux.config in JSON format.
+
+    The parsed settings are cached for the lifetime of the process and
+    only re-read when the config file changes on disk.
+
+    returns: A python dictionary holding the config settings.
+    """
+    return _load_settings_cached(_config_mtime())
+
+
+@functools.lru_cache(maxsize=4)
+def _mapping_trie_cached(mtime):
+    """Builds a character trie out of the configured root mappings.
+
+    Each trie node is a dict keyed by character; a terminal node stores
+    a (prefix_length, mapped_prefix) payload under the None key.  As
+    with _load_settings_cached, mtime is only part of the cache key.
+
+    Parameters:
+
+    mtime (float): The modification time of the config file, or 0 when
+    the file does not exist.
+
+    returns: The root node of the trie.
+    """
+    root = {}
+    mappings = _load_settings_cached(mtime).get("root-mappings", [])
+    for actual, mapped in mappings:
+        node = root
+        for char in actual:
+            node = node.setdefault(char, {})
+        node[None] = (len(actual), mapped)
+    return root
+
+
 def _get_mapped_filename(filename):
     """Returns the mapped file for the passed in filename.
 
@@ -349,12 +441,21 @@ def _get_mapped_filename(filename):
     :Returns: Either the mapped filename if it exists or the actual filename
     otherwise.
     """
-    settings = _load_settings()
-    mappings = settings.get("root-mappings", [])
-    for actual, mapped in mappings:
-        if filename.startswith(actual):
-            return filename.replace(actual, mapped)
-    return filename
+    node = _mapping_trie_cached(_config_mtime())
+    match = None
+    for char in filename:
+        if None in node:
+            match = node[None]
+        node = node.get(char)
+        if node is None:
+            break
+    else:
+        if None in node:
+            match = node[None]
+    if match is None:
+        return filename
+    prefix_length, mapped = match
+    return mapped + filename[prefix_length:]
 
 
 if __name__ == '__main__':